@@ -1,64 +1,166 @@
 import numpy as np
 import cmath
 import math
-from HDual import dual, hdual, hdual_basis
+from functools import lru_cache
+from HDual import dual, dual_batch, hdual, hdual_basis, _FACT, _INV_FACT, _binom_table
+
+@lru_cache(maxsize=None)
+def _hdual_identity(dim):
+    return hdual([1] + [0]*(dim - 1))
 
 def pow(x, p):
     """
         Calculates x^p, where x is a float or dual and p is an integer.
     """
-    if type(x) == hdual_basis:
-        if x.index*p >= x.dim:
-            return hdual_basis(0, x.dim, 0)
-        return hdual_basis(x.index*p, x.dim, (math.factorial(p*x.index)/pow(math.factorial(x.index), p))*pow(x.component, p))
-    if type(x) == hdual:
-        if p == 0:
-            return hdual([1] + [0]*(x.dim - 1))
-        return np.prod([x]*p)
-    if type(x) == dual:
-        return dual(pow(x.re, p), x.im*p*pow(x.re, p-1))
-    return x**p
+    handler = _POW_HANDLERS.get(type(x))
+    if handler is None:
+        return x**p
+    return handler(x, p)
+
+def _pow_hdual_basis(x, p):
+    if x.index*p >= x.dim:
+        return hdual_basis(0, x.dim, 0)
+    if x.index*p < len(_FACT):
+        coeff = _FACT[p*x.index]*pow(_INV_FACT[x.index], p)
+    else:
+        # Past the factorial table, (index*p)!/(index!)^p is built up as the product of choose(k*index, index).
+        coeff = np.prod(_binom_table(x.dim)[x.index*np.arange(2, p + 1), x.index])
+    return hdual_basis(x.index*p, x.dim, coeff*pow(x.component, p))
+
+def _pow_hdual(x, p):
+    result = _hdual_identity(x.dim)
+    if p == 0:
+        return hdual(result.value)
+    base = x
+    while p > 0: # Exponentiation by squaring.
+        if p & 1:
+            result = result*base
+        p >>= 1
+        if p:
+            base = base*base
+    return result
+
+def _pow_dual(x, p):
+    r = x.re**(p - 1)
+    return dual(r*x.re, x.im*p*r)
+
+def _pow_dual_batch(x, p):
+    r = x.re**(p - 1)
+    return dual_batch(r*x.re, x.im*p*r)
+
+_POW_HANDLERS = {hdual_basis: _pow_hdual_basis, hdual: _pow_hdual, dual: _pow_dual, dual_batch: _pow_dual_batch}
 
 def exp(x, complex=False):
     """
         Calculates e^x, where x is a float or dual.
     """
-    if isinstance(x, hdual):
-        return np.prod([exp(x[0], complex=complex)] + 
-                       [np.sum([pow(hdual_basis(i, x.dim, x[i]), j)/math.factorial(j) 
-                                for j in range(math.floor(x.dim/i) + 1)]) 
-                                for i in range(1, x.dim)])
-    if type(x) == dual:
-        return dual(exp(x.re), x.im*exp(x.re))
+    handler = _EXP_HANDLERS.get(type(x))
+    if handler is not None:
+        return handler(x, complex)
     if complex:
         return cmath.exp(x)
     return math.exp(x)
 
+def _exp_hdual(x, complex=False):
+    # y = exp(u) satisfies y' = u'y, and Leibniz' rule on that gives y^(k) = sum_j choose(k - 1, j)u^(j + 1)y^(k - 1 - j),
+    # so each derivative is one dot product with the ones before it.
+    u = x.value
+    binom = _binom_table(x.dim)
+    y0 = exp(u[0], complex=complex)
+    y = np.zeros(x.dim, dtype=np.result_type(u, np.asarray(y0)))
+    y[0] = y0
+    for k in range(1, x.dim):
+        y[k] = np.dot(binom[k - 1, :k]*u[1:k + 1], y[k - 1::-1])
+    return hdual(y)
+
+def _exp_dual(x, complex=False):
+    e = math.exp(x.re)
+    return dual(e, x.im*e)
+
+def _exp_dual_batch(x, complex=False):
+    e = np.exp(x.re)
+    return dual_batch(e, x.im*e)
+
+_EXP_HANDLERS = {hdual: _exp_hdual, hdual_basis: _exp_hdual, dual: _exp_dual, dual_batch: _exp_dual_batch}
+
 def sin(x):
     """
         Calculates sin(x), where x is a float or dual.
     """
-    if type(x) == hdual:
-        if x.dim == 1:
-            return sin(x[0])
-        cexp = exp(1j*x, complex=True)
-        return hdual([cexp[i].imag for i in range(x.dim)])
-    if type(x) == dual:
-        return dual(np.sin(x.re), x.im*np.cos(x.re))
-    return math.sin(x)
-    
+    handler = _SIN_HANDLERS.get(type(x))
+    if handler is None:
+        return math.sin(x)
+    return handler(x)
+
+def _sin_hdual(x):
+    if x.dim == 1:
+        return sin(x[0])
+    return sincos(x)[0]
+
+def _sin_dual(x):
+    return dual(math.sin(x.re), x.im*math.cos(x.re))
+
+def _sin_dual_batch(x):
+    return dual_batch(np.sin(x.re), x.im*np.cos(x.re))
+
+_SIN_HANDLERS = {hdual: _sin_hdual, hdual_basis: _sin_hdual, dual: _sin_dual, dual_batch: _sin_dual_batch}
+
 def cos(x):
     """
         Calculates cos(x), where x is a float or dual.
     """
-    if type(x) == hdual:
-        if x.dim == 1:
-            return cos(x[0])
-        cexp = exp(1j*x, complex=True)
-        return hdual([cexp[i].real for i in range(x.dim)])
-    if type(x) == dual:
-        return dual(np.cos(x.re), -x.im*np.sin(x.re))
-    return math.cos(x)
+    handler = _COS_HANDLERS.get(type(x))
+    if handler is None:
+        return math.cos(x)
+    return handler(x)
+
+def _cos_hdual(x):
+    if x.dim == 1:
+        return cos(x[0])
+    return sincos(x)[1]
+
+def _cos_dual(x):
+    return dual(math.cos(x.re), -x.im*math.sin(x.re))
+
+def _cos_dual_batch(x):
+    return dual_batch(np.cos(x.re), -x.im*np.sin(x.re))
+
+_COS_HANDLERS = {hdual: _cos_hdual, hdual_basis: _cos_hdual, dual: _cos_dual, dual_batch: _cos_dual_batch}
+
+def sincos(x):
+    """
+        Calculates sin(x) and cos(x) together, where x is a float or dual. Each transcendental is only evaluated
+        once, so this is cheaper than calling sin and cos separately.
+    """
+    handler = _SINCOS_HANDLERS.get(type(x))
+    if handler is None:
+        return sin(x), cos(x)
+    return handler(x)
+
+def _sincos_hdual(x):
+    # s = sin(u) and c = cos(u) satisfy s' = u'c and c' = -u's, which give the same Leibniz recurrence as exp.
+    u = x.value
+    binom = _binom_table(x.dim)
+    s0, c0 = sin(u[0]), cos(u[0])
+    dtype = np.result_type(u, np.asarray(s0))
+    s = np.zeros(x.dim, dtype=dtype)
+    c = np.zeros(x.dim, dtype=dtype)
+    s[0], c[0] = s0, c0
+    for k in range(1, x.dim):
+        w = binom[k - 1, :k]*u[1:k + 1]
+        s[k] = np.dot(w, c[k - 1::-1])
+        c[k] = -np.dot(w, s[k - 1::-1])
+    return hdual(s), hdual(c)
+
+def _sincos_dual(x):
+    s, c = math.sin(x.re), math.cos(x.re)
+    return dual(s, x.im*c), dual(c, -x.im*s)
+
+def _sincos_dual_batch(x):
+    s, c = np.sin(x.re), np.cos(x.re)
+    return dual_batch(s, x.im*c), dual_batch(c, -x.im*s)
+
+_SINCOS_HANDLERS = {hdual: _sincos_hdual, hdual_basis: _sincos_hdual, dual: _sincos_dual, dual_batch: _sincos_dual_batch}
 
 if __name__ == "__main__":
-    print(-sin(hdual([1, 1])))
\ No newline at end of file
+    print(-sin(hdual([1, 1])))
@@ -1,10 +1,29 @@
-from AFuncs import pow
 import TDerivs as TD
 import numpy as np
-import math
-from HDual import hdual
+from HDual import hdual, _INV_FACT
 import warnings
 
+_MAX_UNROLLED_TERMS = 64 # Deeper nesting than this gets close to the parser's limit on parentheses.
+
+def _compile_horner(scaled_coeffs, center):
+    """
+        Generates a straight-line Horner evaluator for fixed coefficients, with no loop or indexing at call time.
+        For three terms the generated function is
+
+            def _horner(x, c=center, a0=..., a1=..., a2=...):
+                dx = x - c
+                return (a2*dx + a1)*dx + a0
+    """
+    n = len(scaled_coeffs)
+    expr = f"a{n - 1}" if n else "0.0" # An empty series is the zero function.
+    for i in range(n - 2, -1, -1):
+        expr = f"({expr})*dx + a{i}"
+    params = "".join(f", a{i}=a{i}" for i in range(n))
+    namespace = {f"a{i}": scaled_coeffs[i] for i in range(n)}
+    namespace["c"] = center
+    exec(f"def _horner(x, c=c{params}):\n    dx = x - c\n    return {expr}\n", namespace)
+    return namespace["_horner"]
+
 class tseries(object):
     def __init__(self, coeffs, center=0, num_terms=5):
         """
@@ -23,13 +42,38 @@ class tseries(object):
                 is an iterable. Defaults to 5.
         """
         if callable(coeffs):
-            coeffs = TD.oderivn(coeffs, center, n=num_terms-1, return_lower_derivs=True)
+            coeffs = TD.oderivn(coeffs, center, n=num_terms - 1, return_lower_derivs=True)
         self.coeffs = coeffs
         self.center = center
         self.num_terms = len(coeffs)
+        self.scaled_coeffs = np.asarray(coeffs)*_INV_FACT[:self.num_terms]
+        if self.num_terms <= _MAX_UNROLLED_TERMS:
+            self._call = _compile_horner(self.scaled_coeffs, center)
+        else:
+            self._call = self._horner
     
     def __call__(self, x):
-        return np.sum([self.coeffs[i]*pow(x - self.center, i)/math.factorial(i) for i in range(self.num_terms)])
+        if isinstance(x, np.ndarray):
+            return self._horner_array(x)
+        return self._call(x)
+
+    def _horner_array(self, x):
+        # Works in place on one output array, so evaluating at many points allocates no temporaries per term.
+        dx = np.subtract(x, self.center, dtype=np.result_type(x, self.scaled_coeffs))
+        if not self.num_terms:
+            return np.zeros_like(dx)
+        acc = np.full_like(dx, self.scaled_coeffs[-1])
+        for c in self.scaled_coeffs[-2::-1]:
+            acc *= dx
+            acc += c
+        return acc
+
+    def _horner(self, x):
+        dx = x - self.center
+        acc = self.scaled_coeffs[-1]
+        for c in self.scaled_coeffs[-2::-1]: # Horner's method, so only + and * are needed from x.
+            acc = acc*dx + c
+        return acc
     
     def __str__(self):
         if self.center != 0:
@@ -70,11 +114,23 @@ def ssolve(h, g = lambda x: 0, initial_values=[], center=0, num_terms=5):
         warnings.warn("Number of initial conditions equals or exceeds number of terms specified. Returning initial values only.")
         return tseries(coeffs)
     
-    coeffs.append(h(center) - g(center, *coeffs))
-    for i in range(1, num_terms - len(initial_values)):
-        x = hdual([center, 1] + [0]*(i - 1))
-        coeffs.append((h(x) - g(x, *[hdual(coeffs[j:j+i+1]) for j in range(len(initial_values))]))[i])
-    return tseries(coeffs)
+    n = len(initial_values)
+    first = h(center) - g(center, *initial_values)
+    # Complex centers, initial values or right-hand sides need complex buffers; everything else is float64.
+    coeffs_buf = np.zeros(num_terms, dtype=np.result_type(1.0, center, *initial_values, first))
+    coeffs_buf[:n] = initial_values
+    coeffs_buf[n] = first
+    if num_terms - n == 1:
+        return tseries(coeffs_buf)
+
+    x_buf = np.zeros(num_terms + 1, dtype=np.result_type(1.0, center))
+    x_buf[:2] = center, 1
+    # h does not depend on f, so a single evaluation on the longest jet gives every derivative of h the loop needs.
+    h_jet = h(hdual.from_buffer(x_buf, 0, num_terms - n))
+    for i in range(1, num_terms - n):
+        gx = g(hdual.from_buffer(x_buf, 0, i + 1), *[hdual.from_buffer(coeffs_buf, j, i + 1) for j in range(n)])
+        coeffs_buf[n + i] = (h_jet[i] if isinstance(h_jet, hdual) else 0) - (gx[i] if isinstance(gx, hdual) else 0)
+    return tseries(coeffs_buf)
         
 if __name__ == "__main__":
     pass
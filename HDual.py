@@ -1,6 +1,173 @@
 import numpy as np
 from warnings import warn
-from math import comb
+from math import comb, factorial
+from functools import lru_cache
+
+_MAX_DIM = 171 # 171! overflows a float64.
+_FACT = np.array([factorial(i) for i in range(_MAX_DIM)], dtype=float)
+_INV_FACT = 1.0/_FACT
+
+def _as_components(value):
+    """
+        Copies value into a component array. Integer and boolean entries are stored as float64 so that products
+        take the numeric fast path; complex and object entries are kept as they are.
+    """
+    value = np.asarray(value)
+    if value.dtype.kind in 'biu':
+        return value.astype(np.float64)
+    return value.copy()
+
+def _as_parts(value):
+    """
+        Array view of value for the parts of a dual_batch. Integer and boolean entries are promoted to float64
+        as in _as_components, so that powers neither wrap around nor reject negative exponents.
+    """
+    value = np.asarray(value)
+    if value.dtype.kind in 'biu':
+        return value.astype(np.float64)
+    return value
+
+@lru_cache(maxsize=None)
+def _binom_table(dim):
+    """
+        Pascal's triangle as a (dim, dim) array, with binom[n, k] = choose(n, k).
+    """
+    binom = np.zeros((dim, dim))
+    binom[:, 0] = 1
+    for n in range(1, dim):
+        binom[n, 1:n + 1] = binom[n - 1, :n] + binom[n - 1, 1:n + 1]
+    return binom
+
+@lru_cache(maxsize=None)
+def _lag_index(dim):
+    """
+        (dim, dim) array with lag[n, k] = n - k, clipped at 0 above the diagonal where choose(n, k) is 0 anyway.
+    """
+    return np.maximum(np.subtract.outer(np.arange(dim), np.arange(dim)), 0)
+
+def _hdual_cauchy(a, b, binom, out):
+    """
+        Writes the hyperdual product of the component arrays a and b into out, truncated to len(out), using the
+        precomputed binomial table binom. out[n] = sum_k binom[n, k]a[n - k]b[k] is a matrix-vector product, so
+        the whole sum runs in BLAS rather than in Python.
+    """
+    dim = len(out)
+    dtype = np.result_type(a, b)
+    a_pad = np.zeros(dim, dtype=dtype)
+    a_pad[:min(len(a), dim)] = a[:dim]
+    b_pad = np.zeros(dim, dtype=dtype)
+    b_pad[:min(len(b), dim)] = b[:dim]
+    return np.matmul(binom*a_pad[_lag_index(dim)], b_pad, out=out)
+
+def _hdual_product(a, b, out=None):
+    """
+        Hyperdual product of the component arrays a and b, truncated to the longer of the two. Written into out
+        if it is given. Object arrays (hyperduals of duals, say) skip the float factorial scaling and go through
+        the binomial kernel instead.
+    """
+    dim = max(len(a), len(b))
+    if dim <= _MAX_DIM and a.dtype != object and b.dtype != object:
+        # comb(j + k, k) = (j + k)!/(j!k!), so scaling by the factorials turns the product into a plain convolution.
+        prod = np.convolve(a*_INV_FACT[:len(a)], b*_INV_FACT[:len(b)])[:dim]
+        return np.multiply(prod, _FACT[:dim], out=out)
+    if out is None:
+        out = np.empty(dim, dtype=np.result_type(a, b))
+    return _hdual_cauchy(a, b, _binom_table(dim), out)
+
+class hdual(object):
+    """
+        Class for hyperdual numbers in Python. These are numbers of the form z_01 + z_1e1 + z_2e2 + ... + z_(n - 1)e(n - 1) + z_nen.
+        According to Szirzay-Kalos in 2020, these can be multiplied with the rule 
+        z*w = sum_{j = 0}^n sum_{k = 0}^{n - j} choose(j + k, k) z_jw_k e_{j + k}, a generalization of the multiplication rule for
+        regular dual numbers. They are helpful for finding higher order derivatives.
+
+        Attributes
+        ----------
+        value: iterable
+            A list of the components of the number, starting with the real part then each of the imaginary parts.
+    """
+    __slots__ = ('value', 'dim')
+    __array_priority__ = 100
+
+    def __init__(self, value):
+        self.value = _as_components(value)
+        self.dim = len(self.value)
+
+    @classmethod
+    def from_buffer(cls, buf, offset, dim):
+        """
+            Builds a hyperdual number whose components are a view of buf[offset:offset + dim]. No copy is made,
+            so later writes to buf show up in the number.
+        """
+        z = cls.__new__(cls)
+        z.value = buf[offset:offset + dim]
+        z.dim = dim
+        return z
+
+    def is_real(self):
+        return not self.value[1:].any()
+    
+    def __str__(self):
+        return f"{self.value[0]}" + "".join(f" + {self.value[i]}e{i}" for i in range(1, self.dim))
+    
+    def __repr__(self):
+        return self.__str__
+    
+    def __add__(self, other):
+        if type(other) is hdual and other.dim == self.dim:
+            return hdual.from_buffer(self.value + other.value, 0, self.dim)
+        if isinstance(other, hdual):
+            long, short = (self.value, other.value) if self.dim >= other.dim else (other.value, self.value)
+            c = long.astype(np.result_type(long, short))
+            c[:len(short)] += short
+            return hdual.from_buffer(c, 0, len(c))
+        c = self.value.astype(np.result_type(self.value, other))
+        c[0] += other
+        return hdual.from_buffer(c, 0, self.dim)
+    
+    def __radd__(self, other):
+        return self.__add__(other)
+    
+    def __neg__(self):
+        return hdual(-self.value)
+    
+    def __sub__(self, other):
+        return self + -other
+    
+    def __rsub__(self, other):
+        return -self.__sub__(other)
+    
+    def __mul__(self, other, out=None):
+        try:
+            prod = _hdual_product(self.value, other.value, out)
+        except AttributeError:
+            prod = np.multiply(other, self.value, out=out)
+        return hdual.from_buffer(prod, 0, len(prod))
+    
+    def __rmul__(self, other):
+        return self.__mul__(other)
+    
+    def conj(self):
+        return hdual([self.value[0], *(-self.value[1:])])
+    
+    def __truediv__(self, other):
+        if not isinstance(other, hdual):
+            return hdual.from_buffer(self.value/other, 0, self.dim)
+        w = other.value
+        if abs(self.value[0]) <= 1e-8 and abs(w[0]) <= 1e-8: # 0/0: both real parts within 1e-8 of zero.
+            warn("0/0 encountered. Handling automatically.")
+            return hdual(self[1:])/hdual(w[1:])
+        if not w[1:].any():
+            return self/w[0]
+        return (self*other.conj())/(other*other.conj())
+    
+    def __rtruediv__(self, other):
+        if isinstance(other, hdual) and other.dim == self.dim:
+            return other/self
+        return (other*self.conj())/(self*self.conj())
+    
+    def __getitem__(self, item):
+        return self.value[item]
 
 class dual(hdual):
     """
@@ -13,16 +180,19 @@ class dual(hdual):
         re: real part of dual number ("a" in "a + be").
         im: imaginary part of dual number ("b" in "a + be"). Defaults to 0.
     """
+    __slots__ = ('re', 'im')
+    dim = 2
+
     def __init__(self, re, im=0):
         self.re = re
         self.im = im
-        self.dim = 2
-        self.value = np.array([re, im])
+
+    @property
+    def value(self):
+        return np.array([self.re, self.im])
 
     def is_real(self):
-        if np.is_close(self.im, 0):
-            return True
-        return False
+        return self.im == 0
         
     def __str__(self):
         return f"{self.re} + {self.im}e"
@@ -31,143 +201,146 @@ class dual(hdual):
         return str(self)
     
     def __add__(self, other):
-        if type(other) == dual:
+        if type(other) is dual:
             return dual(self.re + other.re, self.im + other.im)
         return dual(self.re + other, self.im)
         
-    def __radd__(self, other):
-        return self.__add__(other)
+    __radd__ = __add__
     
     def __neg__(self):
         return dual(-self.re, -self.im)
     
     def __sub__(self, other):
-        if type(other) == dual:
+        if type(other) is dual:
             return dual(self.re - other.re, self.im - other.im)
         return dual(self.re - other, self.im)
     
     def __rsub__(self, other):
-        return -self.__sub__(other)
+        return dual(other - self.re, -self.im)
         
     def __mul__(self, other):
-        if type(other) == dual:
+        if type(other) is dual:
             return dual(self.re*other.re, self.im*other.re + self.re*other.im)
         return dual(self.re*other, self.im*other)
         
-    def __rmul__(self, other):
-        return self.__mul__(other)
+    __rmul__ = __mul__
     
     def conj(self):
         return dual(self.re, -self.im)
     
     def __truediv__(self, other):
-        if type(other) == dual:
-            if np.allclose([self.re, other.re], [0,0]):
+        if type(other) is dual:
+            if abs(self.re) <= 1e-8 and abs(other.re) <= 1e-8:
                 return self.im/other.im
-            return dual(self.re/other.re, (self.im*other.re - self.re*other.im)/other.re**2)
+            q = self.re/other.re
+            return dual(q, (self.im - q*other.im)/other.re)
         return dual(self.re/other, self.im/other)
     
     def __rtruediv__(self, other):
-        if type(other) == dual:
-            return other.__truediv__(self)
-        return dual(other/self.re, -other*self.im/self.re**2)
+        # Only reached when other is not a dual, otherwise other.__truediv__ would have been used.
+        q = other/self.re
+        return dual(q, -q*self.im/self.re)
     
     def __getitem(self, item):
         return [self.re, self.im][item]
     
-class hdual(object):
+class dual_batch(object):
     """
-        Class for hyperdual numbers in Python. These are numbers of the form z_01 + z_1e1 + z_2e2 + ... + z_(n - 1)e(n - 1) + z_nen.
-        According to Szirzay-Kalos in 2020, these can be multiplied with the rule 
-        z*w = sum_{j = 0}^n sum_{k = 0}^{n - j} choose(j + k, k) z_jw_k e_{j + k}, a generalization of the multiplication rule for
-        regular dual numbers. They are helpful for finding higher order derivatives.
+        Class for a batch of dual numbers stored as a pair of arrays rather than one object per number. The kth
+        number in the batch is re[k] + im[k]e, so every arithmetic operation on the batch is one NumPy call per
+        part no matter how many numbers it holds. re and im broadcast against each other like any NumPy arrays.
 
         Attributes
         ----------
-        value: iterable
-            A list of the components of the number, starting with the real part then each of the imaginary parts.
+        re: array of the real parts.
+        im: array of the imaginary parts. Defaults to 0.
     """
-    def __init__(self, value):
-        self.value = np.array(value)
-        self.dim = len(self.value)
+    __slots__ = ('re', 'im')
+    __array_priority__ = 100
+
+    def __init__(self, re, im=0):
+        self.re = _as_parts(re)
+        self.im = _as_parts(im)
 
     def is_real(self):
-        if np.allclose(self.value[1:], np.zeros(self.dim-1)):
-            return True
-        return False
-    
+        return not self.im.any()
+
     def __str__(self):
-        return f"{self.value[0]}" + "".join(f" + {self.value[i]}e{i}" for i in range(1, self.dim))
-    
+        return f"{self.re} + {self.im}e"
+
     def __repr__(self):
-        return self.__str__
-    
+        return str(self)
+
     def __add__(self, other):
-        try:
-            l = sorted((self.value, other.value), key=len)
-            c = l[1].copy()
-            c[:len(l[0])] += l[0] #This code is meant to handle adding of arrays of unlike dimension. This is courtesy of Tobia Marucci. Try and find a faster way to do this.
-            return hdual(c)
-        except AttributeError:
-            return hdual([self.value[0] + other, *self.value[1:]])
-    
+        if type(other) == dual_batch:
+            return dual_batch(self.re + other.re, self.im + other.im)
+        return dual_batch(self.re + other, self.im)
+
     def __radd__(self, other):
         return self.__add__(other)
-    
+
     def __neg__(self):
-        return hdual(-self.value)
-    
+        return dual_batch(-self.re, -self.im)
+
     def __sub__(self, other):
-        return self + -other
-    
+        if type(other) == dual_batch:
+            return dual_batch(self.re - other.re, self.im - other.im)
+        return dual_batch(self.re - other, self.im)
+
     def __rsub__(self, other):
         return -self.__sub__(other)
-    
+
     def __mul__(self, other):
-        try:
-            prod = np.zeros(max(self.dim, other.dim), dtype=self.value.dtype)
-            for j in range(self.dim):
-                try:
-                    for k in range(max(self.dim - j, other.dim)):
-                        prod[j + k] += comb(j + k, k)*self.value[j]*other.value[k]
-                except IndexError:
-                    continue
-            return hdual(prod)
-        except AttributeError:
-            return hdual(other*self.value)
-    
+        if type(other) == dual_batch:
+            return dual_batch(self.re*other.re, self.im*other.re + self.re*other.im)
+        return dual_batch(self.re*other, self.im*other)
+
     def __rmul__(self, other):
         return self.__mul__(other)
-    
+
     def conj(self):
-        return hdual([self.value[0], *(-self.value[1:])])
-    
+        return dual_batch(self.re, -self.im)
+
     def __truediv__(self, other):
-        try:
-            if np.allclose([self[0], other[0]], [0, 0]):
-                warn("0/0 encountered. Handling automatically.")
-                return hdual(self[1:])/hdual(other[1:])
-            if other.is_real():
-                return self/other[0]
-            return (self*other.conj())/(other*other.conj())
-        except IndexError:
-            return hdual(self.value/other)
-    
+        if type(other) == dual_batch:
+            return dual_batch(self.re/other.re, (self.im*other.re - self.re*other.im)/other.re**2)
+        return dual_batch(self.re/other, self.im/other)
+
     def __rtruediv__(self, other):
-        if isinstance(other, hdual) and other.dim == self.dim:
-            return other/self
-        return (other*self.conj())/(self*self.conj())
-    
-    def __getitem__(self, item):
-        return self.value[item]
+        return dual_batch(other/self.re, -other*self.im/self.re**2)
 
 class hdual_basis(hdual):
+    __slots__ = ('index', 'component')
+
     def __init__(self, index, dim, component=1):
-        self.value = np.zeros(dim, dtype=type(component))
+        self.value = np.zeros(dim, dtype=_as_components(component).dtype)
         self.value[index] = component
         self.index = index
         self.dim = dim
         self.component = component
+
+    def __mul__(self, other, out=None):
+        if type(other) is hdual_basis:
+            dim = max(self.dim, other.dim)
+            index = self.index + other.index
+            if index >= dim:
+                return hdual_basis(0, dim, 0)
+            return hdual_basis(index, dim, comb(index, self.index)*self.component*other.component)
+        if isinstance(other, hdual):
+            # Only components index + k of the product are nonzero, each weighted by choose(index + k, index).
+            w = other.value
+            dim = max(self.dim, other.dim)
+            m = min(len(w), dim - self.index)
+            if out is None:
+                out = np.zeros(dim, dtype=np.result_type(self.value, w))
+            else:
+                out[:] = 0
+            out[self.index:self.index + m] = _binom_table(dim)[self.index:self.index + m, self.index]*self.component*w[:m]
+            return hdual.from_buffer(out, 0, dim)
+        return hdual_basis(self.index, self.dim, self.component*other)
+
+    def __rmul__(self, other):
+        return self.__mul__(other)
     
     def __str__(self):
         return f"{self.component}e{self.index}"
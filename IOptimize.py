@@ -1,7 +1,9 @@
 import TDerivs as TD
 import numpy as np
+from HDual import dual_batch
+from math import isfinite
 
-def newton(funcs, guess, iters=50):
+def newton(funcs, guess, iters=50, tol=1e-12, jacobian_refresh=1):
     """
         Performs Newton's rootfinding method on a collection of functions. The
         number of functions should equal the number of inputs of each function.
@@ -11,26 +13,268 @@ def newton(funcs, guess, iters=50):
 
         funcs: function or list
             A function or list of functions.
-        guess: number or list
+        guess: number, list or ndarray
             The initial guess for Newton's method.
         iters: int
-            The number of iterations before termination. Defaults to 50.
+            The maximum number of iterations before termination. Defaults to 50.
+        tol: float
+            Iteration stops early once the norm of the function values falls below tol, or once the norm of
+            a step falls below tol*(1 + norm(x)). Defaults to 1e-12. Set to 0 to always run all iterations.
+        jacobian_refresh: int
+            The derivative is only recomputed every jacobian_refresh iterations and reused in between (the
+            chord method), where only the function values are evaluated. Convergence becomes linear, but the
+            intermediate steps are much cheaper for large systems. The step-size stop is only checked on
+            iterations that recompute the derivative. Defaults to 1, which is plain Newton. Must be at least 1.
 
         Returns
         -------
 
         A numpy ndarray with approximation for root.
     """
-    x = guess
-    try:
-        for i in range(iters):
-            dmatrix = [TD.grad(f, x) for f in funcs]
-            x = x - np.matmul(np.linalg.inv(dmatrix), [f(*x) for f in funcs])
-    except TypeError:
-        for i in range(iters):
-            df = TD.oderiv1(funcs, x)
-            x = x - funcs(x)/df
+    if jacobian_refresh < 1:
+        raise ValueError(f"jacobian_refresh must be at least 1, got {jacobian_refresh}.")
+    if callable(funcs):
+        return _newton_scalar(funcs, guess, iters, tol, jacobian_refresh)
+    n = len(funcs)
+    if n == 1:
+        return np.array([_newton_scalar(funcs[0], np.ravel(guess)[0].item(), iters, tol, jacobian_refresh)])
+    x = np.array(guess, dtype=np.float64)
+    J = np.empty((n, n))
+    F = np.empty(n)
+    J_inv = None
+    fill_values = _compile_values(funcs) if jacobian_refresh > 1 else None
+    for i in range(iters):
+        if i % jacobian_refresh == 0:
+            _fill_system(funcs, x, F, J)
+            J_inv = None
+            if np.linalg.norm(F) < tol:
+                break
+            step = _solve(J, F)
+            x -= step
+            if np.linalg.norm(step) < tol*(1 + np.linalg.norm(x)):
+                break
+        else:
+            fill_values(x, F)
+            if J_inv is None:
+                J_inv = np.linalg.inv(J) # Inverted once per refresh so that every reuse is one matrix-vector product.
+            # Chord steps only shrink linearly, so the step size says little about the error. The step from the
+            # residual that has already been computed is taken before stopping on it, since it costs no evaluation.
+            x -= J_inv@F
+            if np.linalg.norm(F) < tol:
+                break
+    return x
+
+def _newton_scalar(f, x, iters, tol, jacobian_refresh=1):
+    """
+        Newton's method for one function of one variable. The value and derivative come from the same dual
+        evaluation of f, and no linear system is built.
+    """
+    for i in range(iters):
+        if i % jacobian_refresh == 0:
+            fx, dfx = TD.grad_and_val(f, x)
+            if abs(fx) < tol:
+                break
+            step = fx/dfx
+            x = x - step
+            if abs(step) < tol*(1 + abs(x)):
+                break
+        else:
+            fx = f(x)
+            x = x - fx/dfx
+            if abs(fx) < tol:
+                break
+    return x
+
+def newton_homeier(funcs, guess, iters=10, tol=1e-12):
+    """
+        Performs Homeier's variant of Newton's method, which evaluates the derivative at the midpoint of the
+        Newton step. Each iteration costs two derivative evaluations instead of one but converges cubically
+        rather than quadratically, so far fewer iterations are needed. The number of functions should equal the
+        number of inputs of each function.
+
+        Parameters
+        ----------
+
+        funcs: function or list
+            A function or list of functions.
+        guess: number, list or ndarray
+            The initial guess for the method.
+        iters: int
+            The maximum number of iterations before termination. Defaults to 10.
+        tol: float
+            Iteration stops early once the norm of the function values falls below tol, or once the norm of
+            a step falls below tol*(1 + norm(x)). Defaults to 1e-12. Set to 0 to always run all iterations.
+
+        Returns
+        -------
+
+        A numpy ndarray with approximation for root.
+    """
+    if callable(funcs):
+        return _homeier_scalar(funcs, guess, iters, tol)
+    n = len(funcs)
+    if n == 1:
+        return np.array([_homeier_scalar(funcs[0], np.ravel(guess)[0].item(), iters, tol)])
+    x = np.array(guess, dtype=np.float64)
+    J = np.empty((n, n))
+    F = np.empty(n)
+    F_mid = np.empty(n)
+    x_mid = np.empty(n)
+    for i in range(iters):
+        _fill_system(funcs, x, F, J)
+        if np.linalg.norm(F) < tol:
+            break
+        np.multiply(_solve(J, F), -0.5, out=x_mid)
+        x_mid += x
+        _fill_system(funcs, x_mid, F_mid, J)
+        step = _solve(J, F)
+        x -= step
+        if np.linalg.norm(step) < tol*(1 + np.linalg.norm(x)):
+            break
     return x
 
+def _homeier_scalar(f, x, iters, tol):
+    """
+        Homeier's method for one function of one variable, with no linear system.
+    """
+    for i in range(iters):
+        fx, dfx = TD.grad_and_val(f, x)
+        if abs(fx) < tol:
+            break
+        step = fx/TD.oderiv1(f, x - fx/(2*dfx))
+        x = x - step
+        if abs(step) < tol*(1 + abs(x)):
+            break
+    return x
+
+def newton_batched(funcs, guesses, iters=50, tol=1e-12):
+    """
+        Runs Newton's method from many initial guesses at once, for instance to find several roots of the same
+        system. Every function is evaluated once per iteration for the whole batch of guesses, and all the
+        Newton steps are taken with one stacked call to np.linalg.solve. Guesses that have converged are no
+        longer evaluated while the rest keep iterating, and a guess that runs into a singular Jacobian is
+        returned as NaN without stopping the others. The functions should be formed from the functions in AFuncs so
+        that they work on arrays.
+
+        Parameters
+        ----------
+
+        funcs: function or list
+            A function or list of functions. The number of functions should equal the number of inputs of
+            each function.
+        guesses: list or ndarray
+            The initial guesses, with shape (B, n) for n functions. For a single function, a list or 1D array
+            of B numbers.
+        iters: int
+            The maximum number of iterations before termination. Defaults to 50.
+        tol: float
+            A guess stops iterating once the norm of its function values falls below tol, or once the norm of
+            its step falls below tol*(1 + norm(x)). Defaults to 1e-12. Set to 0 to always run all iterations.
+
+        Returns
+        -------
+
+        A numpy ndarray with the approximation for the root found from each guess, with the same shape as
+        guesses. Rows whose Jacobian became singular are NaN.
+    """
+    if callable(funcs):
+        return newton_batched([funcs], np.reshape(guesses, (-1, 1)), iters, tol)[:, 0]
+    X = np.array(guesses, dtype=np.float64)
+    B, n = X.shape
+    J = np.empty((B, n, n))
+    F = np.empty((B, n))
+    active = np.arange(B) # Rows of X that are still iterating.
+    for i in range(iters):
+        m = len(active)
+        _fill_batch(funcs, X[active], F[:m], J[:m])
+        unconverged = np.linalg.norm(F[:m], axis=1) >= tol
+        active = active[unconverged]
+        if not len(active):
+            break
+        steps = _solve_batch(J[:m][unconverged], F[:m][unconverged])
+        X[active] -= steps
+        # NaN steps from singular Jacobians fail this comparison too, so those guesses drop out as NaN.
+        active = active[np.linalg.norm(steps, axis=1) >= tol*(1 + np.linalg.norm(X[active], axis=1))]
+    return X
+
+def _solve_batch(J, F):
+    """
+        Solves the stacked systems J[k] s[k] = F[k]. One singular system makes np.linalg.solve fail for the whole
+        stack, so in that case the systems are solved one at a time and the singular ones get NaN steps.
+    """
+    try:
+        return np.linalg.solve(J, F[:, :, None])[:, :, 0]
+    except np.linalg.LinAlgError:
+        steps = np.full(F.shape, np.nan)
+        for k in range(len(F)):
+            try:
+                steps[k] = np.linalg.solve(J[k], F[k])
+            except np.linalg.LinAlgError:
+                pass
+        return steps
+
+def _solve(J, F):
+    """
+        Solves J s = F for the Newton step s. 2 by 2 and 3 by 3 systems are solved in closed form by Cramer's
+        rule, which is much cheaper than a LAPACK call at these sizes; larger systems, and those whose
+        determinant is zero or overflows, go to np.linalg.solve.
+    """
+    n = len(F)
+    if n == 2:
+        (a, b), (c, d) = J.tolist()
+        det = a*d - b*c
+        if det and isfinite(det):
+            f0, f1 = F.tolist()
+            return np.array([(d*f0 - b*f1)/det, (a*f1 - c*f0)/det])
+    elif n == 3:
+        (a, b, c), (d, e, f), (g, h, i) = J.tolist()
+        A, B, C = e*i - f*h, f*g - d*i, d*h - e*g
+        det = a*A + b*B + c*C
+        if det and isfinite(det):
+            f0, f1, f2 = F.tolist()
+            return np.array([(A*f0 + (c*h - b*i)*f1 + (b*f - c*e)*f2)/det,
+                             (B*f0 + (a*i - c*g)*f1 + (c*d - a*f)*f2)/det,
+                             (C*f0 + (b*g - a*h)*f1 + (a*e - b*d)*f2)/det])
+    return np.linalg.solve(J, F)
+
+def _fill_system(funcs, x, F, J):
+    """
+        Writes the values of funcs at x into F and their gradients into the rows of J.
+    """
+    for j, f in enumerate(funcs):
+        F[j], J[j, :] = TD.grad_and_val(f, x)
+
+def _fill_batch(funcs, X, F, J):
+    """
+        Writes the values of funcs at every row of X into the rows of F and their gradients into the stacked
+        Jacobians J. Input i is the column X[:, i] seeded with e_i, which broadcasts to a (B, n) imaginary part,
+        so one evaluation of each function covers the whole batch.
+    """
+    seeds = TD._eye(X.shape[1])
+    x = [dual_batch(X[:, i:i + 1], seed) for i, seed in enumerate(seeds)]
+    for j, f in enumerate(funcs):
+        y = f(*x)
+        F[:, j:j + 1] = y.re
+        J[:, j, :] = y.im
+
+def _compile_values(funcs):
+    """
+        Generates a straight-line function that writes the values of funcs at x into F without differentiating
+        them. x is unpacked once and every call passes its arguments positionally, with no loop or *-unpacking.
+        For two functions the generated function is
+
+            def _values(x, F, f0=..., f1=...):
+                x0, x1 = x.tolist()
+                F[0] = f0(x0, x1)
+                F[1] = f1(x0, x1)
+    """
+    n = len(funcs)
+    args = ", ".join(f"x{i}" for i in range(n))
+    params = "".join(f", f{j}=f{j}" for j in range(n))
+    body = "".join(f"    F[{j}] = f{j}({args})\n" for j in range(n))
+    namespace = {f"f{j}": f for j, f in enumerate(funcs)}
+    exec(f"def _values(x, F{params}):\n    {args}, = x.tolist()\n{body}", namespace)
+    return namespace["_values"]
+
 if __name__ == "__main__":
     pass
\ No newline at end of file
@@ -1,8 +1,19 @@
-from logging import warning
-from typing import Iterable
-from HDual import dual, hdual
+from HDual import dual, dual_batch, hdual
 import numpy as np
 
+_BATCH_MIN_INPUTS = 20 # Below this, n scalar dual passes beat one dual_batch pass (timed on exp/sin sums).
+_EYE_CACHE = {}
+
+def _eye(n):
+    """
+        Cached, read-only n by n identity matrix whose rows are used as gradient seeds.
+    """
+    eye = _EYE_CACHE.get(n)
+    if eye is None:
+        eye = _EYE_CACHE[n] = np.eye(n)
+        eye.flags.writeable = False
+    return eye
+
 def oderiv1(f, x):
     """
         Calculates the derivative of a function f at point x using automatic differentiation
@@ -58,9 +69,10 @@ def pderiv1(f, inputs, partial_index=0):
         ----------
         f: function
             The function whose derivative is being calculated.
-        inputs: list
+        inputs: list or ndarray
             The list of inputs at which the derivative is calculated. It must equal the number
-            of inputs for f.
+            of inputs for f. A list is seeded in place and restored before returning rather than
+            copied; other iterables are copied into a list.
         partial_index: int
             The index of the variable whose partial derivative is being taken. Defaults to 0.
 
@@ -69,9 +81,18 @@ def pderiv1(f, inputs, partial_index=0):
 
         The value of the partial derivative of f at the given point in the given direction.
     """
-    x = inputs.copy()
-    x[partial_index] = dual(inputs[partial_index], 1)
-    return f(*x).im
+    if type(inputs) is list:
+        x = inputs
+    elif type(inputs) is np.ndarray:
+        x = inputs.tolist()
+    else:
+        x = list(inputs)
+    saved = x[partial_index]
+    x[partial_index] = dual(saved, 1)
+    try:
+        return f(*x).im
+    finally:
+        x[partial_index] = saved
 
 def grad(f, inputs):
     """
@@ -82,20 +103,59 @@ def grad(f, inputs):
 
         f: function
             The function whose derivative is being calculated.
-        inputs: number or list
-            If f is 1D, input a number. If f is ND, then input a list of inputs whose length 
+        inputs: number, list or ndarray
+            If f is 1D, input a number. If f is ND, then input a list or 1D array of inputs whose length 
             is the same as the number of inputs of f.
         
         Returns
         -------
 
-        The value of a the derivative/gradient of a function at a point.
+        The value of a the derivative/gradient of a function at a point. A gradient is returned as an ndarray.
     """
-    try:
-        x = list(inputs)
-        return [pderiv1(f, x, i) for i in range(len(inputs))]
-    except TypeError:
-        return oderiv1(f, inputs)
+    return grad_and_val(f, inputs)[1]
+
+def grad_and_val(f, inputs):
+    """
+        Calculates the value of a function together with its derivative/gradient, both from a single evaluation
+        of f.
+
+        Parameters
+        ----------
+
+        f: function
+            The function whose value and derivative are being calculated.
+        inputs: number, list or ndarray
+            If f is 1D, input a number. If f is ND, then input a list or 1D array of inputs whose length 
+            is the same as the number of inputs of f.
+        
+        Returns
+        -------
+
+        A tuple of the value of f and its derivative/gradient at the point.
+    """
+    if np.ndim(inputs) == 0:
+        y = f(dual(inputs, 1))
+        return y.re, y.im
+    n = len(inputs)
+    if n < _BATCH_MIN_INPUTS:
+        # For few inputs the NumPy call overhead of dual_batch outweighs the repeated primal work, so each partial
+        # gets its own pass on scalar duals, seeding one slot at a time.
+        x = inputs.tolist() if type(inputs) is np.ndarray else list(inputs)
+        gradient = np.empty(n)
+        for i in range(n):
+            saved = x[i]
+            x[i] = dual(saved, 1)
+            y = f(*x)
+            # f can come back as a plain number when it does not depend on the seeded input.
+            value, gradient[i] = (y.re, y.im) if isinstance(y, dual) else (y, 0)
+            x[i] = saved
+        return value, gradient
+    seeds = _eye(n)
+    # Each input carries its scalar value and the seed vector e_i as its imaginary part, so the real part is
+    # computed once and one evaluation of f gives every partial at the same time.
+    y = f(*[dual_batch(x_i, seed) for x_i, seed in zip(inputs, seeds)])
+    # y.im can be a seed row itself (for f(x, y) = x, say), so it is copied off the read-only cache.
+    return y.re.item(), y.im.copy()
 
 def dderiv(f, inputs, direction=None):
     """
@@ -106,7 +166,7 @@ def dderiv(f, inputs, direction=None):
 
         f: function
             The function whose derivative is to be calculated.
-        inputs: list
+        inputs: list or ndarray
             The list of points at which the derivative is evaluated. Its length must be equal 
             to the number of inputs of f.
         direction: iterable or None
@@ -119,9 +179,22 @@ def dderiv(f, inputs, direction=None):
         The value of the derivative of f in the given direction.
     """
     if direction is None:
-        return np.linalg.norm(grad(f, inputs))
-    direction = direction/np.linalg.norm(direction)
-    return np.dot(grad(f, inputs), direction)
+        fg = np.ravel(grad(f, inputs))
+        return float(np.sqrt(fg@fg))
+    d = np.ravel(direction).astype(np.float64)
+    # The derivative part is linear in the seeds, so seeding each input with its component of the direction
+    # gives grad(f).d directly from one evaluation on scalar duals, without forming the gradient.
+    if np.ndim(inputs) == 0:
+        y = f(dual(inputs, d.item()))
+    else:
+        y = f(*[dual(x_i, d_i) for x_i, d_i in zip(inputs, d.tolist())])
+    return float(y.im)/float(np.sqrt(d@d))
 
 if __name__ == "__main__":
-    pass
\ No newline at end of file
+    from AFuncs import pow
+    # Integer inputs must give the same derivatives as float ones on both the vector and scalar paths.
+    assert np.isclose(grad_and_val(lambda a, b: pow(a, 25) + b, [10, 1])[0], 1e25)
+    assert list(grad(lambda a, b: pow(a, -1) + b, [2, 3])) == [-0.25, 1.0]
+    assert dderiv(lambda a, b: pow(a, -1) + b, [2, 3], [1, 0]) == -0.25
+    x = list(range(2, 2 + _BATCH_MIN_INPUTS)) # Enough inputs for the dual_batch path.
+    assert grad(lambda *x: pow(x[0], -1) + pow(x[1], 25), x)[:2].tolist() == [-0.25, 25*3.0**24]
\ No newline at end of file